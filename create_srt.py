@@ -4,6 +4,7 @@
 # dependencies = [
 #     "whisperx",
 #     "torch",
+#     "numpy",
 # ]
 # ///
 #
@@ -11,38 +12,41 @@
 # Example: uv run create_srt.py video.mkv
 # Example: uv run create_srt.py /path/to/video/directory
 
-import os
+import stat
 import sys
 import subprocess
 import json
 import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import whisperx
 import torch
 
-def process_video_file(input_file: Path, model, device: str):
+def prepare_audio(input_file: Path, log=print):
     """
-    Processes a single video file to generate an SRT transcription file.
+    Extracts the first audio track from the input video file and uses a two-pass
+    `ffmpeg` `loudnorm` filter to normalize it to 16 kHz mono PCM, piped straight
+    into memory in the format `whisperx` expects.
 
-    This function performs the following steps:
-    1. Extracts the first audio track from the input video file.
-    2. Uses a two-pass `ffmpeg` `loudnorm` filter to normalize the audio and encode it as an MP3.
-    3. Transcribes the normalized MP3 audio to an SRT file using `whisperx`.
-    4. Cleans up the temporary MP3 file.
+    Progress and errors are reported through `log`, so a caller running this in
+    the background can collect the messages and print them later.
+
+    Returns the audio as a float32 array, or None on failure.
     """
     base_name = input_file.name
-    output_file = Path(f"/tmp/{input_file.stem}.mp3")
-    srt_file = input_file.with_suffix(".srt")
 
-    print("--------------------------------------------------")
-    print(f"Processing file: {input_file}")
-    print("--------------------------------------------------")
+    log("--------------------------------------------------")
+    log(f"Processing file: {input_file}")
+    log("--------------------------------------------------")
 
     # First Pass: Measure Loudness
-    print(f"Measuring loudness parameters for {base_name}...")
+    log(f"Measuring loudness parameters for {base_name}...")
     measure_command = [
         "ffmpeg",
         "-hide_banner",
+        "-nostats",
         "-loglevel",
         "info",
         "-threads",
@@ -58,18 +62,22 @@ def process_video_file(input_file: Path, model, device: str):
         "-",
     ]
     try:
-        measure_output_raw = subprocess.check_output(measure_command, stderr=subprocess.STDOUT, text=True)
+        # Keep the output as bytes and decode only the JSON part; the rest of the
+        # log is never read and may contain non-UTF-8 metadata from the source.
+        measure_output_raw = subprocess.check_output(measure_command, stderr=subprocess.STDOUT)
         # Extract the JSON part of the output
-        json_start = measure_output_raw.find('{')
-        json_end = measure_output_raw.rfind('}') + 1
+        json_start = measure_output_raw.find(b'{')
+        json_end = measure_output_raw.rfind(b'}') + 1
         if json_start == -1 or json_end == 0:
-            print(f"Error: Could not find JSON in ffmpeg output for {base_name}.")
-            return False
+            log(f"Error: Could not find JSON in ffmpeg output for {base_name}.")
+            return None
         json_output = measure_output_raw[json_start:json_end]
         loudness_data = json.loads(json_output)
-    except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
-        print(f"Error: Failed to measure loudness for {base_name}. Error: {e}")
-        return False
+    # ValueError covers both JSONDecodeError and a UnicodeDecodeError from
+    # non-UTF-8 bytes that end up inside the extracted slice.
+    except (subprocess.CalledProcessError, ValueError) as e:
+        log(f"Error: Failed to measure loudness for {base_name}. Error: {e}")
+        return None
 
     input_i = loudness_data.get("input_i")
     input_tp = loudness_data.get("input_tp")
@@ -77,15 +85,15 @@ def process_video_file(input_file: Path, model, device: str):
     input_thresh = loudness_data.get("input_thresh")
     offset = loudness_data.get("target_offset", 0.0)
 
-    print(f"Measured values for {base_name}:")
-    print(f"  input_i     : {input_i}")
-    print(f"  input_tp    : {input_tp}")
-    print(f"  input_lra   : {input_lra}")
-    print(f"  input_thresh: {input_thresh}")
-    print(f"  offset      : {offset}")
+    log(f"Measured values for {base_name}:")
+    log(f"  input_i     : {input_i}")
+    log(f"  input_tp    : {input_tp}")
+    log(f"  input_lra   : {input_lra}")
+    log(f"  input_thresh: {input_thresh}")
+    log(f"  offset      : {offset}")
 
-    # Second Pass: Apply Normalization and Convert MP3
-    print(f"Applying loudness normalization and converting to mp3 for {base_name}...")
+    # Second Pass: Apply Normalization and Decode to PCM
+    log(f"Applying loudness normalization and decoding audio for {base_name}...")
     normalize_command = [
         "ffmpeg",
         "-hide_banner",
@@ -100,55 +108,90 @@ def process_video_file(input_file: Path, model, device: str):
         "-af",
         f"loudnorm=I=-16:TP=-1.5:LRA=11:measured_I={input_i}:measured_TP={input_tp}:measured_LRA={input_lra}:measured_thresh={input_thresh}:offset={offset}:linear=true:print_format=summary",
         "-ac",
-        "2",
+        "1",
         "-ar",
         "16000",
         "-c:a",
-        "libmp3lame",
-        "-q:a",
-        "0",
-        str(output_file),
+        "pcm_s16le",
+        "-f",
+        "s16le",
+        "-",
     ]
-    try:
-        subprocess.run(normalize_command, check=True)
-        print(f"Successfully converted {base_name} to MP3: {output_file}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during MP3 conversion for {base_name}. Error: {e}")
-        if output_file.exists():
-            output_file.unlink()
-        return False
+    result = subprocess.run(normalize_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.stderr:
+        log(result.stderr.decode(errors="replace").rstrip())
+    if result.returncode != 0:
+        log(f"Error during audio decoding for {base_name}. Exit code: {result.returncode}")
+        return None
+    log(f"Successfully decoded normalized audio for {base_name}")
+
+    # Scale in place so only the int16 buffer and one float32 array are alive.
+    audio = np.frombuffer(result.stdout, np.int16).astype(np.float32)
+    audio /= 32768.0
+    return audio
+
+def prepare_audio_buffered(input_file: Path):
+    """
+    Runs `prepare_audio` without printing, returning the audio together with the
+    messages it would have printed.
+    """
+    messages = []
+    audio = prepare_audio(input_file, log=messages.append)
+    return audio, messages
+
+@functools.lru_cache(maxsize=1)
+def load_align_model(language_code: str, device: str):
+    """
+    Loads the `whisperx` alignment model for a language, reusing it across
+    consecutive files in the same language. Only one model is kept so device
+    memory stays bounded in mixed-language batches.
+    """
+    return whisperx.load_align_model(language_code=language_code, device=device)
+
+def transcribe_audio(input_file: Path, audio, model, device: str):
+    """
+    Transcribes the normalized audio to an SRT file using `whisperx`.
+    """
+    base_name = input_file.name
+    srt_file = input_file.with_suffix(".srt")
 
     # Create SRT Transcription
     print(f"Creating srt transcription for {base_name} with whisperx...")
     try:
-        audio = whisperx.load_audio(str(output_file))
         result = model.transcribe(audio, batch_size=16)
         
         # Align whisper output
-        model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=device)
+        model_a, metadata = load_align_model(result["language"], device)
         result = whisperx.align(result["segments"], model_a, metadata, audio, device, return_char_alignments=False)
 
         # Write SRT
         writer = whisperx.utils.get_writer("srt", str(input_file.parent))
-        writer(result, str(output_file))
+        writer(result, str(input_file))
 
         print(f"Successfully created SRT: {srt_file}")
 
     except Exception as e:
         print(f"Error during SRT transcription for {base_name}. Error: {e}")
-        if output_file.exists():
-            output_file.unlink()
         return False
-    finally:
-        # Clean up temporary MP3 file
-        if output_file.exists():
-            output_file.unlink()
-            print(f"Cleaned up temporary file: {output_file}")
 
     print(f"Finished processing: {input_file}")
     print("--------------------------------------------------")
     return True
 
+def process_video_file(input_file: Path, model, device: str):
+    """
+    Processes a single video file to generate an SRT transcription file.
+
+    This function performs the following steps:
+    1. Extracts the first audio track from the input video file.
+    2. Uses a two-pass `ffmpeg` `loudnorm` filter to normalize the audio, piping 16 kHz mono PCM into memory.
+    3. Transcribes the normalized audio to an SRT file using `whisperx`.
+    """
+    audio = prepare_audio(input_file)
+    if audio is None:
+        return False
+    return transcribe_audio(input_file, audio, model, device)
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generates SRT transcriptions for video files using ffmpeg and whisperx."
@@ -161,18 +204,17 @@ def main():
     args = parser.parse_args()
     input_path = args.input_path
 
-    if not input_path.exists():
+    # Stat once and branch on the mode; like Path.exists(), treat any stat
+    # failure (missing path, symlink loop, ...) as not found.
+    try:
+        input_mode = input_path.stat().st_mode
+    except OSError:
         print(f"Error: Input path '{input_path}' not found")
         sys.exit(1)
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    compute_type = "float16" if torch.cuda.is_available() else "int8"
-    
-    print(f"Using device: {device} with compute type: {compute_type}")
-    model = whisperx.load_model("large-v3", device, compute_type=compute_type)
-
-
-    if input_path.is_dir():
+    # Resolve the files to process before loading the model so that empty
+    # directories and invalid paths exit without paying the model load cost.
+    if stat.S_ISDIR(input_mode):
         print(f"Input is a directory: {input_path}")
         print("Searching for .mkv files...")
         mkv_files = sorted(list(input_path.glob("*.mkv")))
@@ -184,14 +226,36 @@ def main():
         print(f"Found {len(mkv_files)} .mkv files to process:")
         for file in mkv_files:
             print(f"  {file}")
+    elif not stat.S_ISREG(input_mode):
+        print(f"Error: Input path '{input_path}' is not a valid file or directory.")
+        sys.exit(1)
 
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    compute_type = "float16" if torch.cuda.is_available() else "int8"
+    
+    print(f"Using device: {device} with compute type: {compute_type}")
+    model = whisperx.load_model("large-v3", device, compute_type=compute_type)
+
+
+    if stat.S_ISDIR(input_mode):
         processed_count = 0
         error_count = 0
-        for file in mkv_files:
-            if process_video_file(file, model, device):
-                processed_count += 1
-            else:
-                error_count += 1
+        # Normalize the next file's audio with ffmpeg while the current file is
+        # being transcribed, so the two passes overlap with the whisperx work.
+        # The background step's messages are printed here, once its result is
+        # picked up, so each file's log stays together.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(prepare_audio_buffered, mkv_files[0])
+            for index, file in enumerate(mkv_files):
+                audio, messages = pending.result()
+                for message in messages:
+                    print(message)
+                if index + 1 < len(mkv_files):
+                    pending = executor.submit(prepare_audio_buffered, mkv_files[index + 1])
+                if audio is not None and transcribe_audio(file, audio, model, device):
+                    processed_count += 1
+                else:
+                    error_count += 1
         
         print("==================================================")
         print("Batch processing complete.")
@@ -199,11 +263,7 @@ def main():
         print(f"Failed to process: {error_count} files.")
         print("==================================================")
 
-    elif input_path.is_file():
-        if not process_video_file(input_path, model, device):
-            sys.exit(1)
-    else:
-        print(f"Error: Input path '{input_path}' is not a valid file or directory.")
+    elif not process_video_file(input_path, model, device):
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -38,7 +38,7 @@ process_video_file() {
     # First Pass: Measure Loudness
     # ---------------------------
     echo "Measuring loudness parameters for $base_name..."
-    measure_output=$(ffmpeg -hide_banner -loglevel info -threads auto -i "$input_file" -map 0:a:0 \
+    measure_output=$(ffmpeg -hide_banner -nostats -loglevel info -threads auto -i "$input_file" -map 0:a:0 \
     -af "loudnorm=I=-16:TP=-1.5:LRA=11:print_format=json" -f null - 2>&1 | sed -n '/{/,/}/p')
 
     if [ -z "$measure_output" ]; then